@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 # --- CONFIGURATION ---
 NUM_PROJECTS = 500
 FILENAME = "PDR_Marrakech_Safi_Projects.csv"
+PARQUET_FILENAME = "PDR_Marrakech_Safi_Projects.parquet" # Read by the dashboards
 
 # Real administrative data for the region
 PROVINCES = [
@@ -88,6 +89,8 @@ df = pd.DataFrame(data, columns=[
 
 # Save specifically for Excel usage (utf-8-sig handles French accents correctly)
 df.to_csv(FILENAME, index=False, encoding='utf-8-sig', sep=';')
+# Columnar copy for the dashboards (no text parsing on load)
+df.to_parquet(PARQUET_FILENAME, index=False, compression="zstd")
 
-print(f"✅ Success! File '{FILENAME}' generated with {NUM_PROJECTS} rows.")
+print(f"✅ Success! Files '{FILENAME}' and '{PARQUET_FILENAME}' generated with {NUM_PROJECTS} rows.")
 print("You can now open this in Excel, PowerBI, or load it into a Dashboard.")
\ No newline at end of file
@@ -0,0 +1,111 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+
+# Shared by dashboard.py and dashboard2.py: cache entries are keyed on these
+# definitions, so both scripts reuse the same loaded and filtered frames.
+
+# --- CONFIGURATION ---
+PDR_FILENAME = "PDR_Marrakech_Safi_Projects.parquet"
+# Columns read from the Parquet file: chart inputs plus the fields shown in the detail table and CSV export
+PDR_COLUMNS = [
+    "ID_Projet", "Intitulé_Projet", "Province", "Secteur", "Budget_DH",
+    "Statut", "Taux_Avancement", "Date_Début", "Date_Fin_Prévue"
+]
+# Rows shown in the detailed project table before "Afficher tout" is ticked
+TABLE_MAX_ROWS = 200
+
+# --- LOAD DATA ---
+@st.cache_data
+def load_data():
+    # Raises FileNotFoundError if the data generation script has not been run
+    df = pd.read_parquet(PDR_FILENAME, engine="pyarrow", dtype_backend="pyarrow", columns=PDR_COLUMNS)
+    # Low-cardinality filter columns: categorical codes make isin/groupby cheaper
+    for c in ("Province", "Secteur", "Statut"):
+        df[c] = df[c].astype("category")
+    # Whole-DH budgets and 0-100 percentages fit in narrower integers (int32 / int8)
+    for c in ("Budget_DH", "Taux_Avancement"):
+        df[c] = pd.to_numeric(df[c], downcast="integer")
+
+    # --- SIMULATE GPS COORDINATES ---
+    # Since we don't have real GPS data, we simulate it around Marrakech coordinates
+    # Center of Marrakech-Safi approx: 31.6 -8.0
+    # We add random "jitter" to scatter points across the region
+    rng = np.random.default_rng(42) # Consistent random numbers
+    jitter = rng.uniform(low=[-0.5, -0.8], high=[0.5, 0.8], size=(len(df), 2))
+    df["lat"] = 31.62 + jitter[:, 0]
+    df["lon"] = -8.00 + jitter[:, 1]
+    return df
+
+# --- CACHED FILTERS & AGGREGATIONS ---
+# Keyed on sorted tuples of the selections so reruns with the same filters
+# (in any order) hit the cache instead of redoing the pandas work.
+@st.cache_data
+def apply_filters(_df, provinces, sectors):
+    return _df.query("Province in @provinces and Secteur in @sectors", engine="numexpr")
+
+# --- CHART VIEWS ---
+# Plain helpers: they are only called through build_views, which caches them together.
+def budget_by_province(df_filtered):
+    # Sum budgets directly over the Province category codes (no groupby hash table)
+    codes = df_filtered["Province"].cat.codes.to_numpy()
+    budgets = df_filtered["Budget_DH"].to_numpy(dtype="float64", na_value=0.0)
+    n_provinces = len(df_filtered["Province"].cat.categories)
+    known = codes >= 0
+    totals = np.bincount(codes[known], weights=budgets[known], minlength=n_provinces)
+    present = np.bincount(codes[known], minlength=n_provinces) > 0
+    return pd.DataFrame({
+        "Province": df_filtered["Province"].cat.categories[present],
+        "Budget_DH": totals[present],
+    })
+
+def compute_kpis(df_filtered):
+    # All headline numbers in one pass over the filtered frame
+    avg = df_filtered["Taux_Avancement"].mean()
+    return dict(
+        budget=int(df_filtered["Budget_DH"].sum()),
+        n=len(df_filtered),
+        late=int((df_filtered["Statut"] == "En Retard").sum()),
+        # Arrow columns return pd.NA for an empty selection; keep plain floats for the metrics
+        avg=float("nan") if pd.isna(avg) else float(avg),
+    )
+
+def get_critical_projects(df_filtered):
+    mask = (
+        df_filtered["Statut"].isin(["Suspendu", "En Retard"]) & 
+        (df_filtered["Budget_DH"] > 5000000) # Only big projects
+    )
+    # Partial sort of just the columns the alerts need
+    return df_filtered.loc[mask, ["Province", "Intitulé_Projet", "Statut", "Budget_DH"]].nlargest(5, "Budget_DH")
+
+def progress_box_stats(df_filtered):
+    # Quartiles, 1.5 IQR whiskers and outliers per sector, so the browser gets k rows instead of every project
+    progress = df_filtered["Taux_Avancement"].astype(float)
+    by_sector = progress.groupby(df_filtered["Secteur"], observed=True, sort=False)
+    stats = by_sector.describe(percentiles=[.25, .5, .75])
+    # Tukey whiskers end on the most extreme real values inside [q1 - 1.5 IQR, q3 + 1.5 IQR]
+    q1, q3 = by_sector.transform("quantile", .25), by_sector.transform("quantile", .75)
+    inside = progress.between(q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))
+    whiskers = progress[inside].groupby(df_filtered["Secteur"][inside], observed=True, sort=False).agg(["min", "max"])
+    stats["lowerfence"] = whiskers["min"]
+    stats["upperfence"] = whiskers["max"]
+    # Points beyond the whiskers are still drawn individually, like px.box does
+    beyond = ~inside & progress.notna()
+    fliers = progress[beyond].groupby(df_filtered["Secteur"][beyond], observed=True, sort=False).agg(list)
+    stats["outliers"] = [fliers.get(secteur, []) for secteur in stats.index]
+    return stats
+
+def status_counts(df_filtered):
+    counts = df_filtered["Statut"].value_counts()
+    return counts[counts > 0].rename_axis("Statut").reset_index(name="Nb_Projets")
+
+@st.cache_data
+def build_views(df_filtered):
+    # Every chart input from one cached call: the filtered frame is hashed once per rerun
+    return dict(
+        province_budget=budget_by_province(df_filtered),
+        sector_progress=progress_box_stats(df_filtered),
+        status_counts=status_counts(df_filtered),
+        critical=get_critical_projects(df_filtered),
+        kpis=compute_kpis(df_filtered),
+    )
@@ -1,7 +1,11 @@
+import io
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import numpy as np
+import plotly.graph_objects as go
+
+from common import TABLE_MAX_ROWS, load_data, apply_filters, build_views
 
 import folium
 from streamlit_folium import st_folium
@@ -26,36 +30,52 @@ st.markdown("""
 
 # --- LOAD DATA ---
 @st.cache_data
-def load_data():
-    try:
-        df = pd.read_csv("PDR_Marrakech_Safi_Projects.csv", sep=";")
-        
-        # --- NEW FEATURE: SIMULATE GPS COORDINATES ---
-        # Since we don't have real GPS data, we simulate it around Marrakech coordinates
-        # Center of Marrakech-Safi approx: 31.6 -8.0
-        # We add random "jitter" to scatter points across the region
-        np.random.seed(42) # Consistent random numbers
-        df["lat"] = 31.62 + np.random.uniform(-0.5, 0.5, len(df))
-        df["lon"] = -8.00 + np.random.uniform(-0.8, 0.8, len(df))
-        
-        
-    except FileNotFoundError:
-        return None, None
+def load_water_data():
+    # Arrow-backed like the project table, so st.dataframe can skip the pandas->Arrow conversion
+    return pd.read_csv("Water_Data_Marrakech_Safi.csv", sep=";", engine="pyarrow", dtype_backend="pyarrow")
 
-    try:
-        df_water = pd.read_csv("Water_Data_Marrakech_Safi.csv", sep=";")
-    except FileNotFoundError:
-        st.error("⚠️ Fichier Eau manquant. Lancez le script de génération Eau.")
-        return None, None
+# --- CACHED MAP & EXPORT HELPERS (dashboard-specific) ---
+# Above this many projects the map shows budget aggregated per grid cell instead of one dot per project
+MAP_MAX_POINTS = 5000
 
-    return df, df_water    
+@st.cache_data
+def bin_map_points(df_filtered):
+    # Snap coordinates to a 0.1° grid (~11 km) and sum budgets per cell & sector: the region spans
+    # ~1°x1.6°, so the map shows at most ~190 cells per sector (~1,300 dots) however many projects there are
+    return df_filtered.assign(
+        lat=df_filtered["lat"].round(1), lon=df_filtered["lon"].round(1),
+        Budget_DH=df_filtered["Budget_DH"].astype("int64[pyarrow]") # Cell totals can outgrow int32
+    ).groupby(["lat", "lon", "Secteur"], observed=True, sort=False).agg(
+        Budget_DH=("Budget_DH", "sum"), Nb_Projets=("Budget_DH", "size")
+    ).reset_index()
 
-df, df_water = load_data()
+@st.cache_data
+def to_csv_bytes(df_filtered):
+    return df_filtered.to_csv(index=False, sep=";").encode('utf-8-sig')
 
-if df is None or df_water is None :
-    st.error("⚠️ Veuillez générer le fichier CSV d'abord (Step 1).")
+@st.cache_data
+def to_parquet_bytes(df_filtered):
+    buffer = io.BytesIO()
+    df_filtered.to_parquet(buffer, index=False, compression="zstd")
+    return buffer.getvalue()
+
+try:
+    df = load_data()
+except FileNotFoundError:
+    st.error("⚠️ Données PDR introuvables. Lancez d'abord le script de génération (Marrakech_Safi_Projects_data.py).")
     st.stop()
 
+try:
+    df_water = load_water_data()
+except FileNotFoundError:
+    st.error("⚠️ Fichier Eau manquant. Lancez le script de génération Eau.")
+    st.stop()
+
+# Filter options, read once per rerun from the category index
+PROV_OPTS = df["Province"].cat.categories.tolist()
+SEC_OPTS = df["Secteur"].cat.categories.tolist()
+TYPE_OPTS = df_water["Type"].unique().tolist()
+
 # --- SIDEBAR: FILTERS & EXPORT ---
 st.sidebar.image("https://upload.wikimedia.org/wikipedia/commons/thumb/2/2c/Flag_of_Morocco.svg/1280px-Flag_of_Morocco.svg.png", width=50)
 st.sidebar.title("PORTAIL RÉGIONAL")
@@ -142,16 +162,20 @@ elif navigation == "📊 Pilotage PDR (Projets)":
 #     ]
     col_f1, col_f2 = st.columns(2)
     with col_f1:
-        prov = st.multiselect("Filtrer par Province", df["Province"].unique(), default=df["Province"].unique())
+        prov = st.multiselect("Filtrer par Province", PROV_OPTS, default=PROV_OPTS)
     with col_f2:
-        sect = st.multiselect("Filtrer par Secteur", df["Secteur"].unique(), default=df["Secteur"].unique())
+        sect = st.multiselect("Filtrer par Secteur", SEC_OPTS, default=SEC_OPTS)
         
-    df_filtered = df[(df["Province"].isin(prov)) & (df["Secteur"].isin(sect))]
+    if len(prov) == len(PROV_OPTS) and len(sect) == len(SEC_OPTS):
+        df_filtered = df # Everything selected: nothing to filter
+    else:
+        df_filtered = apply_filters(df, tuple(sorted(prov)), tuple(sorted(sect)))
 
     # --- NEW FEATURE: EXPORT DATA ---
     st.sidebar.markdown("---")
     st.sidebar.header("📂 Exportation")
-    csv = df_filtered.to_csv(index=False, sep=";").encode('utf-8-sig')
+    # Serialized once per filter combination, not on every rerun
+    csv = to_csv_bytes(df_filtered)
     st.sidebar.download_button(
         label="📥 Télécharger en Excel (CSV)",
         data=csv,
@@ -159,17 +183,26 @@ elif navigation == "📊 Pilotage PDR (Projets)":
         mime='text/csv',
         help="Télécharger les données filtrées pour usage administratif."
     )
+    st.sidebar.download_button(
+        label="📥 Télécharger en Parquet",
+        data=to_parquet_bytes(df_filtered),
+        file_name='Projets_PDR_Filtres.parquet',
+        mime='application/vnd.apache.parquet',
+        help="Format compact pour Python, PowerBI ou DuckDB."
+    )
 
 # --- HEADER & KPIs ---
     st.title("🗺️ Tableau de Bord Stratégique : Région Marrakech-Safi")
     st.markdown("### Suivi de l'Exécution du Plan de Développement Régional (PDR)")
 
 
+    views = build_views(df_filtered)
+    kpis = views["kpis"]
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("💰 Budget Engagé", f"{df_filtered['Budget_DH'].sum()/1e6:.1f} MDH", delta="En Millions de DH")
-    col2.metric("🏗️ Projets Actifs", len(df_filtered))
-    col3.metric("⚠️ Projets en Retard", len(df_filtered[df_filtered["Statut"] == "En Retard"]), delta_color="inverse")
-    col4.metric("✅ Taux d'Achèvement Moyen", f"{df_filtered['Taux_Avancement'].mean():.1f}%")
+    col1.metric("💰 Budget Engagé", f"{kpis['budget']/1e6:.1f} MDH", delta="En Millions de DH")
+    col2.metric("🏗️ Projets Actifs", kpis["n"])
+    col3.metric("⚠️ Projets en Retard", kpis["late"], delta_color="inverse")
+    col4.metric("✅ Taux d'Achèvement Moyen", f"{kpis['avg']:.1f}%")
 
     st.markdown("---")
 
@@ -178,15 +211,23 @@ elif navigation == "📊 Pilotage PDR (Projets)":
 
     with col_map:
         st.subheader("📍 Carte Territoriale des Projets")
+        if len(df_filtered) > MAP_MAX_POINTS:
+            # Too many dots for the browser: plot one dot per grid cell & sector
+            map_data = bin_map_points(df_filtered)
+            hover_name, hover_data = "Secteur", {"Nb_Projets": True, "lat": False, "lon": False}
+        else:
+            map_data = df_filtered
+            hover_name, hover_data = "Intitulé_Projet", {"Province": True, "Statut": True, "lat": False, "lon": False}
+
         # Using Plotly Mapbox for professional look
         fig_map = px.scatter_mapbox(
-            df_filtered, 
+            map_data, 
             lat="lat", 
             lon="lon", 
             color="Secteur",
             size="Budget_DH", # Bigger budget = Bigger dot
-            hover_name="Intitulé_Projet",
-            hover_data={"Province": True, "Statut": True, "lat": False, "lon": False},
+            hover_name=hover_name,
+            hover_data=hover_data,
             zoom=7, 
             center={"lat": 31.62, "lon": -8.00},
             mapbox_style="carto-positron", # Clean map style
@@ -200,36 +241,53 @@ elif navigation == "📊 Pilotage PDR (Projets)":
         st.markdown("Projets nécessitant une **intervention immédiate** (Statut: Suspendu ou En Retard > 10MDH).")
 
         # Filter for "Critical" projects
-        critical_projects = df_filtered[
-            (df_filtered["Statut"].isin(["Suspendu", "En Retard"])) & 
-            (df_filtered["Budget_DH"] > 5000000) # Only big projects
-        ].sort_values("Budget_DH", ascending=False).head(5)
+        critical_projects = views["critical"]
 
-        for index, row in critical_projects.iterrows():
-            st.error(f"**{row['Province']}**: {row['Intitulé_Projet']} ({row['Statut']})")
+        # Build all alert lines at once and render them in a single component
+        alerts = (
+            "**" + critical_projects["Province"].astype(str) + "**: "
+            + critical_projects["Intitulé_Projet"].astype(str)
+            + " (" + critical_projects["Statut"].astype(str) + ")"
+        ).tolist()
+        if alerts:
+            st.error("\n\n".join(alerts))
 
     # --- ROW 3: ANALYTICS ---
     col_left, col_right = st.columns(2)
 
     with col_left:
         st.subheader("📊 Répartition Budgétaire par Province")
-        fig_bar = px.bar(
-            df_filtered.groupby("Province")["Budget_DH"].sum().reset_index(),
-            x="Budget_DH", y="Province", orientation="h",
-            color="Budget_DH", color_continuous_scale="Viridis",
-            text_auto=".2s"
-        )
+        # Already aggregated (one row per province): build the trace directly, no Plotly Express layer
+        budget = views["province_budget"].sort_values("Budget_DH")
+        fig_bar = go.Figure(go.Bar(
+            x=budget["Budget_DH"], y=budget["Province"], orientation="h",
+            marker=dict(color=budget["Budget_DH"], colorscale="Viridis", showscale=True, colorbar=dict(title="Budget_DH")),
+            texttemplate="%{x:.2s}"
+        ))
+        fig_bar.update_layout(xaxis_title="Budget_DH", yaxis_title="Province")
         st.plotly_chart(fig_bar, use_container_width=True)
 
     with col_right:
         st.subheader("📈 Avancement par Secteur")
         # Box plot is better for engineering roles: it shows distribution of progress
-        fig_box = px.box(
-            df_filtered, 
-            x="Secteur", 
-            y="Taux_Avancement", 
-            color="Secteur",
-            title="Dispersion de l'avancement des projets par secteur"
+        fig_box = go.Figure()
+        colors = px.colors.qualitative.Plotly
+        for i, (secteur, row) in enumerate(views["sector_progress"].iterrows()):
+            color = colors[i % len(colors)]
+            fig_box.add_trace(go.Box(
+                name=secteur, x=[secteur], legendgroup=secteur, marker_color=color,
+                q1=[row["25%"]], median=[row["50%"]], q3=[row["75%"]],
+                lowerfence=[row["lowerfence"]], upperfence=[row["upperfence"]]
+            ))
+            if row["outliers"]:
+                # Outliers beyond the whiskers, in the same color as their box
+                fig_box.add_trace(go.Scatter(
+                    name=secteur, x=[secteur] * len(row["outliers"]), y=row["outliers"],
+                    mode="markers", marker_color=color, legendgroup=secteur, showlegend=False
+                ))
+        fig_box.update_layout(
+            title="Dispersion de l'avancement des projets par secteur",
+            xaxis_title="Secteur", yaxis_title="Taux_Avancement", legend_title="Secteur"
         )
         st.plotly_chart(fig_box, use_container_width=True)
 
@@ -239,19 +297,25 @@ elif navigation == "📊 Pilotage PDR (Projets)":
         st.subheader("🏗️ État d'Avancement des Projets")
         # A Pie Chart showing project status (Blocked, Done, In Progress)
         fig_status = px.pie(
-            df_filtered,
+            views["status_counts"],
             names="Statut",
+            values="Nb_Projets",
             title="Répartition des Projets par Statut",
             color_discrete_sequence=px.colors.sequential.RdBu
         )
         st.plotly_chart(fig_status, use_container_width=True)
 
     st.subheader("📋 Liste Détaillée des Projets")
-    st.dataframe(df_filtered)
+    # Only the biggest budgets are sent to the browser unless the full list is requested
+    if st.checkbox("Afficher tout", value=False):
+        st.dataframe(df_filtered)
+    else:
+        st.caption(f"Top {TABLE_MAX_ROWS} projets par budget.")
+        st.dataframe(df_filtered.nlargest(TABLE_MAX_ROWS, "Budget_DH"), use_container_width=True, height=400)
 
 elif navigation == "💧 Vigilance Eau (SIG)":
     # st.sidebar.title("💧 Filtres Hydrologiques")
-    selected_type = st.multiselect("Type d'Infrastructure", df_water["Type"].unique(), default=df_water["Type"].unique())
+    selected_type = st.multiselect("Type d'Infrastructure", TYPE_OPTS, default=TYPE_OPTS)
     show_critical = st.checkbox("Afficher uniquement les zones CRITIQUES", value=False)
 
     # Apply filters
@@ -1,42 +1,42 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+
+from common import TABLE_MAX_ROWS, load_data, apply_filters, build_views
 
 # --- PAGE SETUP ---
 st.set_page_config(page_title="Tableau de Bord PDR Marrakech-Safi", layout="wide")
 
 # --- LOAD DATA ---
-@st.cache_data
-def load_data():
-    # Make sure the filename matches exactly what you generated
-    df = pd.read_csv("PDR_Marrakech_Safi_Projects.csv", sep=";")
-    return df
-
 try:
     df = load_data()
 except FileNotFoundError:
     st.error("⚠️ File not found! Please run the data generation script first.")
     st.stop()
 
+# Filter options, read once per rerun from the category index
+PROV_OPTS = df["Province"].cat.categories.tolist()
+SEC_OPTS = df["Secteur"].cat.categories.tolist()
+
 # --- SIDEBAR FILTERS ---
 st.sidebar.header("🔍 Filtres Régionaux")
 selected_province = st.sidebar.multiselect(
     "Choisir la Province",
-    options=df["Province"].unique(),
-    default=df["Province"].unique() # Select all by default
+    options=PROV_OPTS,
+    default=PROV_OPTS # Select all by default
 )
 
 selected_sector = st.sidebar.multiselect(
     "Choisir le Secteur",
-    options=df["Secteur"].unique(),
-    default=df["Secteur"].unique()
+    options=SEC_OPTS,
+    default=SEC_OPTS
 )
 
 # Filter the data based on selection
-df_filtered = df[
-    (df["Province"].isin(selected_province)) & 
-    (df["Secteur"].isin(selected_sector))
-]
+if len(selected_province) == len(PROV_OPTS) and len(selected_sector) == len(SEC_OPTS):
+    df_filtered = df # Everything selected: nothing to filter
+else:
+    df_filtered = apply_filters(df, tuple(sorted(selected_province)), tuple(sorted(selected_sector)))
 
 # --- MAIN DASHBOARD ---
 st.title("📊 Suivi du PDR - Région Marrakech-Safi")
@@ -44,9 +44,11 @@ st.markdown("---")
 
 # --- TOP KPIS (Key Performance Indicators) ---
 # These represent the "Big Numbers" the Governor cares about
-total_budget = df_filtered["Budget_DH"].sum()
-total_projects = len(df_filtered)
-avg_progress = df_filtered["Taux_Avancement"].mean()
+views = build_views(df_filtered)
+kpis = views["kpis"]
+total_budget = kpis["budget"]
+total_projects = kpis["n"]
+avg_progress = kpis["avg"]
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Budget Total Investi", f"{total_budget:,.0f} DH")
@@ -61,15 +63,19 @@ col_left, col_right = st.columns(2)
 with col_left:
     st.subheader("💰 Disparités Budgétaires par Province")
     # A Bar Chart showing which province gets the most money
-    fig_budget = px.bar(
-        df_filtered.groupby("Province")["Budget_DH"].sum().reset_index(),
-        x="Budget_DH",
-        y="Province",
+    # Already aggregated (one row per province): build the trace directly, no Plotly Express layer
+    budget = views["province_budget"].sort_values("Budget_DH")
+    fig_budget = go.Figure(go.Bar(
+        x=budget["Budget_DH"],
+        y=budget["Province"],
         orientation="h",
-        text_auto=".2s",
-        color="Budget_DH",
-        color_continuous_scale="Viridis",
-        title="Budget Alloué par Province (DH)"
+        texttemplate="%{x:.2s}",
+        marker=dict(color=budget["Budget_DH"], colorscale="Viridis", showscale=True, colorbar=dict(title="Budget_DH"))
+    ))
+    fig_budget.update_layout(
+        title="Budget Alloué par Province (DH)",
+        xaxis_title="Budget_DH",
+        yaxis_title="Province"
     )
     st.plotly_chart(fig_budget, use_container_width=True)
 
@@ -77,8 +83,9 @@ with col_right:
     st.subheader("🏗️ État d'Avancement des Projets")
     # A Pie Chart showing project status (Blocked, Done, In Progress)
     fig_status = px.pie(
-        df_filtered,
+        views["status_counts"],
         names="Statut",
+        values="Nb_Projets",
         title="Répartition des Projets par Statut",
         color_discrete_sequence=px.colors.sequential.RdBu
     )
@@ -86,4 +93,9 @@ with col_right:
 
 # --- DETAILED DATA TABLE ---
 st.subheader("📋 Liste Détaillée des Projets")
-st.dataframe(df_filtered)
\ No newline at end of file
+# Only the biggest budgets are sent to the browser unless the full list is requested
+if st.checkbox("Afficher tout", value=False):
+    st.dataframe(df_filtered)
+else:
+    st.caption(f"Top {TABLE_MAX_ROWS} projets par budget.")
+    st.dataframe(df_filtered.nlargest(TABLE_MAX_ROWS, "Budget_DH"), use_container_width=True, height=400)
\ No newline at end of file